@@ -1,19 +1,129 @@
 import streamlit as st
-import pandas as pd
 import datetime
+import hashlib
+import hmac
+import json
+import math
+import os
+import re
+import string
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from utils import db_manager
 import utils.llm_helper as llm_helper
 import utils.pdf_utils as pdf_utils
 
-# Verify the function exists (Streamlit hot-reload debug)
-if not hasattr(llm_helper, 'process_audio_to_form'):
-    st.error("llm_helper missing 'process_audio_to_form'. Attempting to force reload.")
-    import importlib
-    importlib.reload(llm_helper)
-
 # Constants
 DEFAULT_TARGET_AUDIENCE = "Recruiters"
 JOB_DESC_FILE_TYPES = ["txt"]
+CONTEXT_COLS = ('date', 'category', 'description', 'impact_metric', 'company', 'title')
+MAX_CONTEXT_ROWS = 30  # Longer histories are trimmed to the rows most relevant to the JD
+HISTORY_PAGE_SIZE = 50
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_FILENAME_UNSAFE_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+# Tab 3 generation prompt; built once, only the per-request fields are substituted
+RESUME_PROMPT_TEMPLATE = string.Template("""You are an expert Career Coach and Professional Resume Writer.
+
+TASK: Create a tailored resume AND cover letter that ALIGN the provided career accomplishments with the requirements and responsibilities found in the Job Description below.
+
+$company_context
+
+JOB DESCRIPTION:
+$job_description
+
+TARGET AUDIENCE: $target_audience
+
+APPLICANT CONTACT INFO:
+$contact_info
+
+INSTRUCTIONS:
+1. Infer the Company Name and Job Title from the Job Description.
+2. Estimate a "Fit Score" (Low/Medium/High) based on how well the experience aligns with the job.
+3. Write a concise cover letter (3-4 paragraphs, max 300 words) referencing specific accomplishments.
+4. Select and emphasize relevant accomplishments for the resume.
+5. Quantify impact metrics where available.
+6. Enforce character limits: Professional Summary (~500 chars), Job Summaries (~150 chars), Accomplishments (~150 chars).
+7. Return the result strictly as a JSON object with the specified structure.
+8. If Education is mentioned in accomplishments or context, populate the Education section; otherwise, leave it empty.
+
+OUTPUT FORMAT (JSON):
+{
+    "Fit Score": "Low/Medium/High",
+    "Company": "Name of the company inferred from the job description",
+    "Job Title": "Name of the job title inferred from the job description",
+    "Cover Letter": "The main body of the generated cover letter...",
+    "Resume": {
+        "Professional Summary": "A strong, tailored summary (Max 500 characters)...",
+        "Experience": {
+             "Job Title, Company": {
+                   "Start Date": "YYYY-MM-DD",
+                   "End Date": "YYYY-MM-DD or Present",
+                   "Summary": "One sentence summary (Max 150 characters)...",
+                   "Accomplishments": [
+                        "Accomplishment 1 (Max 150 characters)...",
+                        "Accomplishment 2 (Max 150 characters)...",
+                        "Accomplishment 3 (Max 150 characters)..."
+                   ]
+             }
+             // Add more positions as relevant, in Reverse Chronological Order
+        },
+        "Education": {
+             "Degree Name": {
+                 "Type of Degree": "BSc/MSc/PhD etc.",
+                 "Major": "Major field of study",
+                 "School": "University/School Name",
+                 "Graduation Date": "YYYY-MM-DD or Year",
+                 "Information of Note": "Honors, Thesis, etc."
+             }
+             // Add more degrees if relevant
+        }
+    }
+}
+""")
+
+# Tab 1 form fields (callables are evaluated when the key is first set)
+ACC_DEFAULTS = {
+    'acc_date': datetime.date.today,
+    'acc_category': "",
+    'acc_company': "",
+    'acc_title': "",
+    'acc_description': "",
+    'acc_impact': "",
+}
+
+def select_relevant_accomplishments(df, job_description, top_k=MAX_CONTEXT_ROWS):
+    """
+    Keep the top_k rows whose description/impact best match the job description (TF-IDF style term overlap).
+    Histories of top_k rows or fewer are returned unchanged; original row order is preserved.
+    """
+    if len(df) <= top_k or not job_description:
+        return df
+
+    jd_terms = set(_TOKEN_RE.findall(job_description.lower()))
+    text_cols = df.reindex(columns=['description', 'impact_metric']).fillna('').astype(str)
+    text = text_cols['description'] + ' ' + text_cols['impact_metric']
+    row_terms = text.str.lower().str.findall(_TOKEN_RE).apply(set)
+
+    # Rare terms shared with the JD count for more than common ones
+    doc_freq = Counter(term for terms in row_terms for term in terms)
+    n_rows = len(df)
+    scores = row_terms.apply(lambda terms: sum(math.log(n_rows / doc_freq[t]) + 1 for t in terms & jd_terms))
+
+    return df[df.index.isin(scores.nlargest(top_k).index)]
+
+def sanitize_filename(s):
+    """Lowercase, underscores for spaces, anything else non-alphanumeric dropped."""
+    if not s: return "unknown"
+    return _FILENAME_UNSAFE_RE.sub('', s.replace(' ', '_').lower())
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def read_job_description(file_id, _data_bytes):
+    """
+    Decode an uploaded JD once per upload. Keyed on file_id only (the leading underscore skips hashing the bytes).
+    The cache is process-wide, so it is capped; older uploads are evicted and just decode again if reused.
+    """
+    return _data_bytes.decode("utf-8")
 
 # Page Configuration
 st.set_page_config(
@@ -22,10 +132,41 @@ st.set_page_config(
     layout="wide"
 )
 
+# Verify the function exists (Streamlit hot-reload debug, dev only)
+@st.cache_resource(show_spinner=False)
+def ensure_llm_helper_loaded():
+    """Force-reload llm_helper once per process if a hot-reload left it stale."""
+    if not hasattr(llm_helper, 'process_audio_to_form'):
+        st.error("llm_helper missing 'process_audio_to_form'. Attempting to force reload.")
+        import importlib
+        importlib.reload(llm_helper)
+
+if os.environ.get("CAREEROS_DEV"):
+    ensure_llm_helper_loaded()
+
 # Initialize DB
 db_manager.init_db()
 
 # --- Authentication Logic ---
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_credentials(entries):
+    """
+    Parse the (username, stored value) pairs from st.secrets["credentials"] into {username: SHA-256 digest}.
+    Keyed on the entries themselves, so a rotated or revoked password takes effect as soon as secrets reload.
+    Values should be SHA-256 hex digests; anything else is treated as a legacy plaintext password and hashed here.
+    """
+    credentials = {}
+    for username, stored in entries:
+        stored = str(stored)
+        try:
+            digest = bytes.fromhex(stored)
+        except ValueError:
+            digest = b""
+        if len(digest) != hashlib.sha256().digest_size:
+            digest = hashlib.sha256(stored.encode("utf-8")).digest()
+        credentials[username] = digest
+    return credentials
+
 def check_password():
     """Returns `True` if the user had a correct password."""
     def login_form():
@@ -38,10 +179,16 @@ def check_password():
             submitted = st.form_submit_button("Log In", type="primary")
             
             if submitted:
-                # Check against secrets
-                if "credentials" in st.secrets:
-                    known_users = st.secrets["credentials"]
-                    if input_username in known_users and known_users[input_username] == input_password:
+                # Check against secrets (hashed, constant-time comparison)
+                # Read secrets on every submit (they reload when secrets.toml changes); only the parse is cached
+                raw_credentials = st.secrets["credentials"] if "credentials" in st.secrets else {}
+                entries = tuple(sorted((str(k), str(v)) for k, v in raw_credentials.items()))
+                known_users = load_credentials(entries)
+                if known_users:
+                    input_digest = hashlib.sha256(input_password.encode("utf-8")).digest()
+                    # Unknown users compare against an all-zero digest, so both paths cost the same
+                    stored_digest = known_users.get(input_username, bytes(len(input_digest)))
+                    if hmac.compare_digest(stored_digest, input_digest):
                         st.session_state["authentication_status"] = True
                         st.session_state["username"] = input_username # Store username
                         st.rerun()
@@ -72,41 +219,44 @@ if not check_password():
 
 st.title("CareerOS")
 
+# Resolve the logged-in user once; it is passed to each tab so cache keys stay consistent
+CURRENT_USER = st.session_state["username"]
+
+# Fetch the user's history once per rerun; both History and Generator tabs share it
+df_all = db_manager.get_accomplishments_cached(CURRENT_USER)
+
 # Create Tabs
 tab1, tab2, tab3 = st.tabs(["📂 Log Accomplishment", "📜 Achievement History", "🎯 Tailored Resume Generator"])
 
 # --- Tab 1: Log Accomplishment ---
-with tab1:
+@st.fragment
+def log_tab(user):
+    """Log Accomplishment tab. Runs as a fragment so its widgets only rerun this tab."""
     st.header("Log New Accomplishment")
     
     # Initialize session state for fields if not present
-    if 'acc_date' not in st.session_state:
-        st.session_state['acc_date'] = datetime.date.today()
-    if 'acc_category' not in st.session_state:
-        st.session_state['acc_category'] = ""
-    if 'acc_company' not in st.session_state:
-        st.session_state['acc_company'] = ""
-    if 'acc_title' not in st.session_state:
-        st.session_state['acc_title'] = ""
-    if 'acc_description' not in st.session_state:
-        st.session_state['acc_description'] = ""
-    if 'acc_impact' not in st.session_state:
-        st.session_state['acc_impact'] = ""
+    for key, default in ACC_DEFAULTS.items():
+        st.session_state.setdefault(key, default() if callable(default) else default)
     
     # Voice Input Section (Must be outside form to trigger reruns)
     audio_file = st.audio_input("Voice Input Option", width="stretch")
 
-    if audio_file:
+    # The recorder keeps its audio across reruns; only send a recording to Gemini once
+    audio_hash = hashlib.blake2b(audio_file.getbuffer(), digest_size=16).hexdigest() if audio_file else None
+
+    if audio_file and st.session_state.get('last_audio_hash') != audio_hash:
         with st.spinner("Gemini is analyzing your recording..."):
-            audio_bytes = audio_file.read()
-            # Process audio to JSON
-            parsed_data = llm_helper.process_audio_to_form(audio_bytes, audio_file.type)
+            # Process audio to JSON (the UploadedFile is streamed to Gemini as-is)
+            parsed_data = llm_helper.process_audio_to_form(audio_file, audio_file.type)
+            # Mark this recording as handled whether or not it parsed, so reruns don't resend it
+            # (or let a late success overwrite edits); recording again is how the user retries
+            st.session_state['last_audio_hash'] = audio_hash
             
             if parsed_data:
                 # Update session state with parsed values
                 try:
-                    st.session_state['acc_date'] = datetime.datetime.strptime(parsed_data.get('date', ''), '%Y-%m-%d').date()
-                except:
+                    st.session_state['acc_date'] = datetime.date.fromisoformat(str(parsed_data.get('date') or ''))
+                except ValueError:
                     st.session_state['acc_date'] = datetime.date.today()
         
                 st.session_state['acc_category'] = parsed_data.get('category', '')
@@ -116,7 +266,7 @@ with tab1:
                 st.session_state['acc_impact'] = parsed_data.get('impact_metric', '')
                 st.toast("Transcribed and parsed! Review the form below.")
             else:
-                st.warning("Could not parse audio. Please try again or type manually.")
+                st.warning("Could not parse audio. Please record again or type manually.")
 
     # Manual Entry Form
     with st.form("accomplishment_form", clear_on_submit=False):
@@ -142,7 +292,7 @@ with tab1:
                         impact_metric=impact_metric,
                         company=company,
                         title=title,
-                        user=st.session_state.get("username", "default")
+                        user=user
                     )
                     st.success("Accomplishment saved successfully!")
                     # Clear session state after successful save
@@ -156,7 +306,9 @@ with tab1:
                     st.error(f"Error saving accomplishment: {e}")        
 
 # --- Tab 2: Achievement History ---
-with tab2:
+@st.fragment
+def history_tab(user, total_rows):
+    """Achievement History tab: paginated inline editor, save and delete."""
     st.header("Your Achievement History")
     
     # Session state for delete selection
@@ -164,12 +316,25 @@ with tab2:
         st.session_state["delete_selected"] = []
 
     try:
-        current_user = st.session_state.get("username", "default")
-        df_acc = db_manager.get_accomplishments(user=current_user)
+        # Only one page is sent to the browser; changing pages reruns just this fragment
+        n_pages = max(1, math.ceil(total_rows / HISTORY_PAGE_SIZE))
+        page = 1
+        if n_pages > 1:
+            # Deletes can shrink the page count below a page number kept in state; clamp before rendering
+            st.session_state["history_page"] = min(st.session_state.get("history_page", 1), n_pages)
+            page = st.number_input("Page", min_value=1, max_value=n_pages, step=1, key="history_page")
+        page = min(page, n_pages)
+        # The cached frame is shared across reruns; the editor/save path gets its own copy
+        df_acc = db_manager.get_accomplishments_cached(
+            user, limit=HISTORY_PAGE_SIZE, offset=(page - 1) * HISTORY_PAGE_SIZE
+        ).copy()
+
         if not df_acc.empty:
             
             # --- Editing Interface ---
             st.caption("Double-click any cell to edit. Changes are saved when you click the button below.")
+            if n_pages > 1:
+                st.caption(f"Page {page} of {n_pages} ({total_rows} entries)")
             
             # Reset index to ensure compatible behavior with hide_index=True and num_rows="dynamic"
             df_acc = df_acc.reset_index(drop=True)
@@ -180,7 +345,7 @@ with tab2:
                 width="stretch", # Replaced use_container_width=True
                 hide_index=True,
                 disabled=["id"],  # Prevent editing IDs
-                key="history_editor",
+                key=f"history_editor_{page}",
                 num_rows="dynamic" # Allow adding/deleting rows
             )
             
@@ -189,33 +354,22 @@ with tab2:
             if st.button("💾 Save Changes"):
                 with st.spinner("Syncing changes to Google Sheets..."):
                     # Detect differences
-                    # Iterate through rows and check for changes
-                    # (Simple approach: Updates each row that differs. 
-                    # For optimization, we could filter, but for <100 rows, iteration is fast enough logic-wise)
-                    
-                    changes_count = 0
-                    for index, row in edited_df.iterrows():
-                        original_row = df_acc.iloc[index]
-                        
-                        # Check if ANY field changed
-                        has_changes = False
-                        for col in df_acc.columns:
-                            if str(row[col]) != str(original_row[col]):
-                                has_changes = True
-                                break
-                        
-                        if has_changes:
-                            db_manager.update_accomplishment(
-                                id_val=row['id'],
-                                date=str(row['date']),
-                                category=row['category'],
-                                description=row['description'],
-                                impact_metric=row['impact_metric'],
-                                company=row['company'],
-                                title=row['title']
-                            )
-                            changes_count += 1
-                    
+                    # Only compare rows present in both frames (rows added/removed in the editor are skipped)
+                    common_idx = edited_df.index.intersection(df_acc.index)
+                    # The editor can upcast columns (e.g. int -> float once a cell is touched);
+                    # cast back to the original dtypes so 5 vs 5.0 isn't seen as an edit
+                    edited_rows = edited_df.loc[common_idx, df_acc.columns].astype(df_acc.dtypes.to_dict(), errors="ignore")
+                    # Blank cells come back from the editor as None/NaN; normalize so they don't count as edits
+                    edited_rows = edited_rows.fillna('')
+                    original_rows = df_acc.loc[common_idx].fillna('')
+
+                    # One vectorized pass flags every row where any cell differs
+                    changed_mask = (edited_rows.astype(str).values != original_rows.astype(str).values).any(axis=1)
+                    changed = edited_rows[changed_mask].to_dict("records")
+
+                    # Single batched write instead of one round-trip per row
+                    changes_count = db_manager.update_accomplishments_bulk(changed)
+
                     if changes_count > 0:
                         st.success(f"Successfully updated {changes_count} entries!")
                         st.rerun()
@@ -226,9 +380,9 @@ with tab2:
 
             # --- Deletion Interface ---
             with st.expander("🗑️ Delete Entries"):
-                st.warning("Deletion is permanent.")
+                st.warning("Deleted entries are hidden from CareerOS but kept in the sheet ('deleted' column).")
                 id_to_delete = st.text_input("Paste ID (UUID) to delete", help="Copy the ID from the table above")
-                if st.button("Permanently Delete"):
+                if st.button("Delete Entry"):
                     if id_to_delete:
                         with st.spinner("Deleting..."):
                             db_manager.delete_accomplishment(id_to_delete)
@@ -239,8 +393,195 @@ with tab2:
     except Exception as e:
         st.error(f"Error loading history: {e}")
 
+# --- Tab 3 Review & Finalize fragments ---
+@st.fragment
+def review_fragment(content, version):
+    """Review & Edit sub-tab. Edits here rerun only this fragment."""
+    import pandas as pd  # Only needed for the accomplishment editors
+
+    st.markdown("### Cover Letter")
+    # Editable Cover Letter
+    cl_key = f"cl_edit_{version}"
+    new_cl_text = st.text_area(
+        "Edit Cover Letter Content", 
+        value=content.get('Cover Letter', ''),
+        height=300,
+        key=cl_key
+    )
+
+    st.divider()
+    st.markdown("### Professional Summary")
+    # Editable Professional Summary
+    prof_sum_key = f"prof_sum_edit_{version}"
+    new_prof_sum = st.text_area(
+        "Edit Professional Summary", 
+        value=content.get('Resume', {}).get('Professional Summary', ''),
+        height=150,
+        key=prof_sum_key
+    )
+    
+    st.divider()
+    st.markdown("### Experience")
+    
+    # We need to capture the state of inclusions. 
+    # We will use a dictionary to track the 'final' state locally for the Generate button to read.
+    # However, since Streamlit re-runs, we rely on session_state values for the widgets.
+    
+    experience = content.get('Resume', {}).get('Experience', {})
+    
+    # Containers for layout
+    for i, (job_title_key, job_details) in enumerate(experience.items()):
+        with st.expander(f"Job: {job_title_key}", expanded=True):
+            
+            # Checkbox to include the whole job
+            job_inc_key = f"job_{i}_include_{version}"
+            include_job = st.checkbox(
+                f"Include '{job_title_key}' in Resume", 
+                value=True, 
+                key=job_inc_key
+            )
+            
+
+            if include_job:
+                # Edited Summary
+                sum_key = f"job_{i}_summary_{version}"
+                st.text_input(
+                    "Job Summary", 
+                    value=job_details.get('Summary', ''), 
+                    key=sum_key
+                )
+                
+                st.caption("Select & Edit Accomplishments:")
+                acc_list = job_details.get('Accomplishments', [])
+                # One editor per job instead of a checkbox + text area per bullet
+                acc_df = pd.DataFrame({"Include": [True] * len(acc_list), "Accomplishment": acc_list})
+                edited_accs = st.data_editor(
+                    acc_df,
+                    column_config={
+                        "Include": st.column_config.CheckboxColumn("Include", width="small"),
+                        "Accomplishment": st.column_config.TextColumn("Accomplishment", width="large"),
+                    },
+                    hide_index=True,
+                    width="stretch",
+                    key=f"job_{i}_acc_editor_{version}"
+                )
+                # Keep the edited frame where the Generate step can read it
+                st.session_state[f"job_{i}_accs_{version}"] = edited_accs
+
+@st.fragment
+def finalize_fragment(content, version, contact_data, company_name):
+    """Generate & Download sub-tab: applies the review edits and builds the PDFs."""
+    st.write("Once you are happy with your edits and selections, click the button below to generate your PDFs.")
+    
+    if st.button("✨ Apply Changes & Generate PDFs", type="primary"):
+        with st.spinner("Generating Custom PDFs..."):
+            # Reconstruct the data dictionary based on widget states
+            final_data = content.copy()
+            
+            # Update Cover Letter
+            final_data['Cover Letter'] = st.session_state.get(f"cl_edit_{version}", "")
+            
+            # Rebuild Experience
+            final_resume = final_data.get('Resume', {}).copy()
+            
+            # Update Professional Summary
+            final_resume['Professional Summary'] = st.session_state.get(f"prof_sum_edit_{version}", "")
+
+            original_experience = final_resume.get('Experience', {})
+            new_experience = {}
+            
+            for i, (job_title_key, job_details) in enumerate(original_experience.items()):
+                # Check if job is included
+                if st.session_state.get(f"job_{i}_include_{version}", True):
+                    new_job_details = job_details.copy()
+                    
+                    # Update Summary
+                    new_job_details['Summary'] = st.session_state.get(f"job_{i}_summary_{version}", job_details.get('Summary', ''))
+                    
+                    # Filter Accomplishments (included rows of the job's editor; if it never rendered, the originals)
+                    edited_accs = st.session_state.get(f"job_{i}_accs_{version}")
+                    if edited_accs is not None:
+                        kept = edited_accs.loc[edited_accs["Include"].fillna(False).astype(bool), "Accomplishment"]
+                        candidate_accs = kept.fillna("").astype(str).tolist()
+                    else:
+                        candidate_accs = job_details.get('Accomplishments', [])
+                    # Only add if not empty
+                    new_job_details['Accomplishments'] = [acc for acc in candidate_accs if acc.strip()]
+                    
+                    new_experience[job_title_key] = new_job_details
+            
+            final_resume['Experience'] = new_experience
+            final_data['Resume'] = final_resume
+
+            # Skip the rebuild when nothing that goes into the PDFs has changed since the last click
+            digest = hashlib.blake2b(
+                json.dumps([final_data, contact_data], sort_keys=True, default=str).encode("utf-8"), digest_size=16
+            ).hexdigest()
+            if st.session_state.get('last_pdf_digest') == digest and st.session_state.get('generated_pdf_resume'):
+                st.toast("No changes — reusing previous PDFs.")
+            else:
+                # Generate PDFs (independent, so build both concurrently). The pool is per click:
+                # a process-wide one would queue every session's renders behind two workers.
+                with ThreadPoolExecutor(max_workers=2, thread_name_prefix="careeros-pdf") as executor:
+                    cl_future = executor.submit(pdf_utils.create_cover_letter_pdf, final_data, contact_data)
+                    resume_future = executor.submit(pdf_utils.create_resume_pdf, final_data, contact_data)
+                    try:
+                        cl_pdf = cl_future.result()
+                        resume_pdf = resume_future.result()
+                    except Exception as e:
+                        cl_pdf = resume_pdf = None
+                        st.error(f"Error generating PDFs: {e}")
+                st.session_state['generated_pdf_cl'] = cl_pdf
+                st.session_state['generated_pdf_resume'] = resume_pdf
+                if cl_pdf and resume_pdf:
+                    st.session_state['last_pdf_digest'] = digest
+                    st.success("PDFs Generated!")
+                else:
+                    st.session_state['last_pdf_digest'] = None
+                    st.error("Could not generate the PDFs. Please try again.")
+
+            
+            # Sanitize filenames
+            s_user = sanitize_filename(contact_data.get('name') or "applicant")
+            s_company = sanitize_filename(company_name or "company")
+            
+            st.session_state['base_filename'] = f"{s_user}_{s_company}"
+            
+    # Download Buttons
+    col_d1, col_d2 = st.columns(2)
+    with col_d1:
+        if st.session_state.get('generated_pdf_cl'):
+            base_name = st.session_state.get('base_filename', 'document')
+            st.download_button(
+                label="📥 Download Cover Letter",
+                data=st.session_state['generated_pdf_cl'],
+                file_name=f"{base_name}_cover_letter.pdf",
+                mime="application/pdf"
+            )
+        else:
+            st.info("Click 'Generate PDFs' to create the file.")
+            
+    with col_d2:
+        if st.session_state.get('generated_pdf_resume'):
+            base_name = st.session_state.get('base_filename', 'document')
+            st.download_button(
+                label="📥 Download Resume",
+                data=st.session_state['generated_pdf_resume'],
+                file_name=f"{base_name}_resume.pdf",
+                mime="application/pdf"
+            )
+        else:
+            st.info("Click 'Generate PDFs' to create the file.")
+    
+    st.divider()
+    with st.expander("Debugger - View Structured Data"):
+         st.json(content)
+
+
 # --- Tab 3: Tailored Resume Generator ---
-with tab3:
+@st.fragment
+def generator_tab(df):
+    """Tailored Resume Generator tab: job details, generation, review and download."""
     st.header("Generate Tailored Assets")
     st.markdown("Match your history against a specific job description.")
     
@@ -250,7 +591,8 @@ with tab3:
     st.subheader("Job Details")
     
 
-
+    # Contact details and company stay outside the form: they also feed the PDFs and filenames,
+    # so corrections made after drafting must reach "Apply Changes & Generate PDFs" without regenerating
     # Personal Details
     st.markdown("### Contact Information")
     pd_col1, pd_col2 = st.columns(2)
@@ -260,56 +602,54 @@ with tab3:
     with pd_col2:
         user_phone = st.text_input("Phone", placeholder="(555) 123-4567", key="user_phone_input")
         user_linkedin = st.text_input("LinkedIn URL", placeholder="linkedin.com/in/...", key="user_linkedin_input")
-    
+
     # Company Name Input (New)
-    company_name = st.text_input("Company Name (Optional)", help="If provided, this will ensure the cover letter is addressed correctly.")
+    company_name = st.text_input("Company Name (Optional)", help="If provided, this will ensure the cover letter is addressed correctly.", key="company_name_input")
+
+    # Batch the job-description widgets in a form: typing in them doesn't rerun the tab until Generate is clicked
+    with st.form("jd_form", clear_on_submit=False):
+        # Job Description Input
+        # (Inside a form the uploader doesn't rerun on change, so the paste box is always shown; an upload takes precedence)
+        uploaded_file = st.file_uploader(
+            "Upload Job Description (.txt)",
+            type=JOB_DESC_FILE_TYPES,
+            key="jd_uploader"
+        )
+        pasted_description = st.text_area("Or paste Job Description here", height=200)
+
+        st.markdown("---")
+        available_models, default_index = llm_helper.get_model_options()
+        model_name = st.selectbox("Select Model:", available_models, index=default_index if available_models else None, key="model_sel")
+
+        generate_clicked = st.form_submit_button("Generate Assets", type="primary")
 
-    # Job Description Input
     job_description = ""
-    uploaded_file = st.file_uploader(
-        "Upload Job Description (.txt)",
-        type=JOB_DESC_FILE_TYPES,
-        key="jd_uploader"
-    )
     if uploaded_file is not None:
         try:
-            job_description = uploaded_file.read().decode("utf-8")
+            job_description = read_job_description(uploaded_file.file_id, uploaded_file.getvalue())
             st.info("Job description loaded from file.")
         except Exception as e:
             st.error(f"Error reading file: {e}")
-            
-    # Text Area Fallback
     if not job_description:
-        job_description = st.text_area("Or paste Job Description here", height=200)
-
-    st.markdown("---")
-    available_models = llm_helper.get_available_models()
-    default_index = 0
-    if available_models:
-        try:
-            default_index = available_models.index("gemini-flash-latest")
-        except ValueError:
-            default_index = 0
-    model_name = st.selectbox("Select Model:", available_models, index=default_index if available_models else None, key="model_sel")
+        job_description = pasted_description
     
     # ----------------------------
     # GENERATION LOGIC
     # ----------------------------
-    if st.button("Generate Assets", type="primary"):
+    if generate_clicked:
         if not job_description:
             st.warning("Please provide a Job Description.")
         else:
             with st.spinner("Analyzing profile and generating content..."):
                 try:
-                    current_user = st.session_state.get("username", "default")
-                    df = db_manager.get_accomplishments(user=current_user)
                     if df.empty:
                         st.error("No accomplishments found in database! Please log some achievements first.")
                     else:
                         # Filter relevant columns for context
-                        context_cols = ['date', 'category', 'description', 'impact_metric', 'company', 'title']
-                        subset_df = df[[c for c in context_cols if c in df.columns]]
-                        context_data = subset_df.to_string(index=False)
+                        subset_df = df[df.columns.intersection(CONTEXT_COLS)]
+                        subset_df = select_relevant_accomplishments(subset_df, job_description)
+                        # CSV is far denser than to_string's padded columns (fewer prompt tokens)
+                        context_data = subset_df.to_csv(index=False)
                         
                         # Append Contact Info
                         contact_info = f"""
@@ -325,67 +665,43 @@ with tab3:
                         # We inject company name explicitly if provided
                         company_context = f"COMPANY NAME: {company_name}" if company_name else "COMPANY NAME: Infer from Job Description"
 
-                        prompt = f"""You are an expert Career Coach and Professional Resume Writer.
-
-TASK: Create a tailored resume AND cover letter that ALIGN the provided career accomplishments with the requirements and responsibilities found in the Job Description below.
-
-{company_context}
-
-JOB DESCRIPTION:
-{job_description}
-
-TARGET AUDIENCE: {target_audience}
-
-APPLICANT CONTACT INFO:
-{contact_info}
-
-INSTRUCTIONS:
-1. Infer the Company Name and Job Title from the Job Description.
-2. Estimate a "Fit Score" (Low/Medium/High) based on how well the experience aligns with the job.
-3. Write a concise cover letter (3-4 paragraphs, max 300 words) referencing specific accomplishments.
-4. Select and emphasize relevant accomplishments for the resume.
-5. Quantify impact metrics where available.
-6. Enforce character limits: Professional Summary (~500 chars), Job Summaries (~150 chars), Accomplishments (~150 chars).
-7. Return the result strictly as a JSON object with the specified structure.
-8. If Education is mentioned in accomplishments or context, populate the Education section; otherwise, leave it empty.
-
-OUTPUT FORMAT (JSON):
-{{
-    "Fit Score": "Low/Medium/High",
-    "Company": "Name of the company inferred from the job description",
-    "Job Title": "Name of the job title inferred from the job description",
-    "Cover Letter": "The main body of the generated cover letter...",
-    "Resume": {{
-        "Professional Summary": "A strong, tailored summary (Max 500 characters)...",
-        "Experience": {{
-             "Job Title, Company": {{
-                   "Start Date": "YYYY-MM-DD",
-                   "End Date": "YYYY-MM-DD or Present",
-                   "Summary": "One sentence summary (Max 150 characters)...",
-                   "Accomplishments": [
-                        "Accomplishment 1 (Max 150 characters)...",
-                        "Accomplishment 2 (Max 150 characters)...",
-                        "Accomplishment 3 (Max 150 characters)..."
-                   ]
-             }}
-             // Add more positions as relevant, in Reverse Chronological Order
-        }},
-        "Education": {{
-             "Degree Name": {{
-                 "Type of Degree": "BSc/MSc/PhD etc.",
-                 "Major": "Major field of study",
-                 "School": "University/School Name",
-                 "Graduation Date": "YYYY-MM-DD or Year",
-                 "Information of Note": "Honors, Thesis, etc."
-             }}
-             // Add more degrees if relevant
-        }}
-    }}
-}}
-"""
+                        prompt = RESUME_PROMPT_TEMPLATE.substitute(
+                            company_context=company_context,
+                            job_description=job_description,
+                            target_audience=target_audience,
+                            contact_info=contact_info
+                        )
                         
-                        # Call new structured generation function
-                        response_dict = llm_helper.generate_structured_content(prompt, context_data=context_data, model_name=model_name)
+                        # Identical inputs give an identical request; reuse the earlier draft instead of another Gemini call
+                        gen_key = hashlib.blake2b(
+                            "\0".join((prompt, context_data, model_name)).encode("utf-8"), digest_size=16
+                        ).hexdigest()
+                        generation_cache = st.session_state.setdefault('generation_cache', {})
+                        response_dict = generation_cache.get(gen_key)
+
+                        if response_dict is not None:
+                            st.toast("Inputs unchanged — reusing the previous draft.")
+                        else:
+                            # Stream the draft and show the fit score and cover letter as they arrive,
+                            # rather than the raw JSON
+                            stream_box = st.empty()
+                            chunks = []
+                            try:
+                                for chunk in llm_helper.generate_content_stream(prompt, context_data=context_data, model_name=model_name, json_output=True):
+                                    chunks.append(chunk)
+                                    partial = llm_helper.parse_partial_fields("".join(chunks), ("Fit Score", "Cover Letter"))
+                                    if partial:
+                                        stream_box.markdown(
+                                            f"**Fit Score:** {partial.get('Fit Score', '…')}\n\n{partial.get('Cover Letter', '')}"
+                                        )
+                                raw_output = "".join(chunks)
+                            except llm_helper.GenerationStopped:
+                                # Already reported (finish reason / safety ratings); don't parse truncated JSON
+                                raw_output = ""
+                            stream_box.empty()
+                            response_dict = llm_helper.parse_structured_output(raw_output) if raw_output else None
+                            if response_dict:
+                                generation_cache[gen_key] = response_dict
                         
                         if response_dict:
                             st.session_state['generated_profile'] = response_dict
@@ -426,176 +742,17 @@ OUTPUT FORMAT (JSON):
             
             # --- Tab 1: Review & Edit ---
             with review_tab:
-                st.markdown("### Cover Letter")
-                # Editable Cover Letter
-                cl_key = f"cl_edit_{version}"
-                new_cl_text = st.text_area(
-                    "Edit Cover Letter Content", 
-                    value=content.get('Cover Letter', ''),
-                    height=300,
-                    key=cl_key
-                )
-
-                st.divider()
-                st.markdown("### Professional Summary")
-                # Editable Professional Summary
-                prof_sum_key = f"prof_sum_edit_{version}"
-                new_prof_sum = st.text_area(
-                    "Edit Professional Summary", 
-                    value=content.get('Resume', {}).get('Professional Summary', ''),
-                    height=150,
-                    key=prof_sum_key
-                )
-                
-                st.divider()
-                st.markdown("### Experience")
-                
-                # We need to capture the state of inclusions. 
-                # We will use a dictionary to track the 'final' state locally for the Generate button to read.
-                # However, since Streamlit re-runs, we rely on session_state values for the widgets.
-                
-                experience = content.get('Resume', {}).get('Experience', {})
-                
-                # Containers for layout
-                for i, (job_title_key, job_details) in enumerate(experience.items()):
-                    with st.expander(f"Job: {job_title_key}", expanded=True):
-                        
-                        # Checkbox to include the whole job
-                        job_inc_key = f"job_{i}_include_{version}"
-                        include_job = st.checkbox(
-                            f"Include '{job_title_key}' in Resume", 
-                            value=True, 
-                            key=job_inc_key
-                        )
-                        
-
-                        if include_job:
-                            # Edited Summary
-                            sum_key = f"job_{i}_summary_{version}"
-                            st.text_input(
-                                "Job Summary", 
-                                value=job_details.get('Summary', ''), 
-                                key=sum_key
-                            )
-                            
-                            st.caption("Select & Edit Accomplishments:")
-                            acc_list = job_details.get('Accomplishments', [])
-                            for j, acc in enumerate(acc_list):
-                                acc_inc_key = f"job_{i}_acc_{j}_include_{version}"
-                                acc_text_key = f"job_{i}_acc_{j}_text_{version}"
-                                
-                                ac_col1, ac_col2 = st.columns([0.05, 0.95])
-                                with ac_col1:
-                                    st.checkbox("", value=True, key=acc_inc_key)
-                                with ac_col2:
-                                    st.text_area(
-                                        "Accomplishment", 
-                                        value=acc, 
-                                        height=68, 
-                                        key=acc_text_key, 
-                                        label_visibility="collapsed"
-                                    )
+                review_fragment(content, version)
 
             # --- Tab 2: Generate & Download ---
             with finalize_tab:
-                st.write("Once you are happy with your edits and selections, click the button below to generate your PDFs.")
-                
-                if st.button("✨ Apply Changes & Generate PDFs", type="primary"):
-                    with st.spinner("Generating Custom PDFs..."):
-                        # Reconstruct the data dictionary based on widget states
-                        final_data = content.copy()
-                        
-                        # Update Cover Letter
-                        final_data['Cover Letter'] = st.session_state.get(cl_key, "")
-                        
-                        # Rebuild Experience
-                        final_resume = final_data.get('Resume', {}).copy()
-                        
-                        # Update Professional Summary
-                        final_resume['Professional Summary'] = st.session_state.get(prof_sum_key, "")
-
-                        original_experience = final_resume.get('Experience', {})
-                        new_experience = {}
-                        
-                        for i, (job_title_key, job_details) in enumerate(original_experience.items()):
-                            # Check if job is included
-                            if st.session_state.get(f"job_{i}_include_{version}", True):
-                                new_job_details = job_details.copy()
-                                
-                                # Update Summary
-                                new_job_details['Summary'] = st.session_state.get(f"job_{i}_summary_{version}", job_details.get('Summary', ''))
-                                
-                                # Filter Accomplishments
-                                original_accs = job_details.get('Accomplishments', [])
-                                new_accs = []
-                                for j, acc in enumerate(original_accs):
-                                    # Check inclusion
-                                    if st.session_state.get(f"job_{i}_acc_{j}_include_{version}", True):
-                                        # Get edited text
-                                        edited_acc_text = st.session_state.get(f"job_{i}_acc_{j}_text_{version}", acc)
-                                        if edited_acc_text.strip(): # Only add if not empty
-                                            new_accs.append(edited_acc_text)
-                                new_job_details['Accomplishments'] = new_accs
-                                
-                                new_experience[job_title_key] = new_job_details
-                        
-                        final_resume['Experience'] = new_experience
-                        final_data['Resume'] = final_resume
-        
-                        # Prepare Contact Info
-                        contact_data = {
-                            'name': user_name,
-                            'email': user_email,
-                            'phone': user_phone,
-                            'linkedin': user_linkedin
-                        }
-
-                        # Generate PDFs
-                        st.session_state['generated_pdf_cl'] = pdf_utils.create_cover_letter_pdf(final_data, contact_data)
-                        st.session_state['generated_pdf_resume'] = pdf_utils.create_resume_pdf(final_data, contact_data)
-                        st.success("PDFs Generated!")
-
-                        
-                        # Sanitize filenames
-                        import re
-                        def sanitize(s):
-                            if not s: return "unknown"
-                            return re.sub(r'[^a-zA-Z0-9_]', '', s.replace(' ', '_').lower())
-
-                        s_user = sanitize(user_name or "applicant")
-                        s_company = sanitize(company_name or "company")
-                        
-                        st.session_state['base_filename'] = f"{s_user}_{s_company}"
-                        
-                # Download Buttons
-                col_d1, col_d2 = st.columns(2)
-                with col_d1:
-                    if st.session_state.get('generated_pdf_cl'):
-                        base_name = st.session_state.get('base_filename', 'document')
-                        st.download_button(
-                            label="📥 Download Cover Letter",
-                            data=st.session_state['generated_pdf_cl'],
-                            file_name=f"{base_name}_cover_letter.pdf",
-                            mime="application/pdf"
-                        )
-                    else:
-                        st.info("Click 'Generate PDFs' to create the file.")
-                        
-                with col_d2:
-                    if st.session_state.get('generated_pdf_resume'):
-                        base_name = st.session_state.get('base_filename', 'document')
-                        st.download_button(
-                            label="📥 Download Resume",
-                            data=st.session_state['generated_pdf_resume'],
-                            file_name=f"{base_name}_resume.pdf",
-                            mime="application/pdf"
-                        )
-                    else:
-                        st.info("Click 'Generate PDFs' to create the file.")
-                
-                st.divider()
-                with st.expander("Debugger - View Structured Data"):
-                     st.json(content)
+                # Live widget values (not the ones captured at Generate), so contact fixes reach the PDFs
+                finalize_fragment(content, version, {
+                    'name': user_name,
+                    'email': user_email,
+                    'phone': user_phone,
+                    'linkedin': user_linkedin
+                }, company_name)
 
         else:
             # Fallback for legacy state
@@ -603,3 +760,14 @@ OUTPUT FORMAT (JSON):
             st.write(content)
     else:
         st.info("Upload a JD and click Generate to see results.")
+
+
+# Render each tab as its own fragment
+with tab1:
+    log_tab(CURRENT_USER)
+
+with tab2:
+    history_tab(CURRENT_USER, len(df_all))
+
+with tab3:
+    generator_tab(df_all)
@@ -8,64 +8,74 @@ import uuid
 from utils import db_manager
 
 DB_FILE = "career_os.db"
+SHEET_COLUMNS = ["id", "date", "category", "description", "impact_metric", "company", "title"]
+# Rows read from SQLite and appended per call; bounds memory and keeps each request well under the Sheets payload limit
+CHUNK_ROWS = 5000
+
+# Read-side tuning for the one-off bulk read. WAL/synchronous only matter for writers,
+# and this script never writes to the SQLite file.
+READ_PRAGMAS = [
+    "PRAGMA query_only=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA busy_timeout=5000",
+]
+
+def connect_readonly(path):
+    """
+    Open the SQLite DB read-only with the read PRAGMAs applied.
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _build_rows(chunk):
+    """
+    Turn a chunk of SQLite rows into sheet rows (vectorized; missing source columns become blank).
+    """
+    rows = chunk.reindex(columns=SHEET_COLUMNS).fillna("").astype(str)
+    # Generate new UUIDs for the sheet
+    rows["id"] = [str(uuid.uuid4()) for _ in range(len(rows))]
+    return rows.values.tolist()
 
 def migrate_data():
     print(f"Reading from {DB_FILE}...")
     try:
-        conn = sqlite3.connect(DB_FILE)
-        query = "SELECT * FROM accomplishments"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        conn = connect_readonly(DB_FILE)
     except Exception as e:
         print(f"Error reading SQLite DB: {e}")
         return
 
-    if df.empty:
-        print("No data found in SQLite database to migrate.")
-        return
-
-    print(f"Found {len(df)} records. Connecting to Google Sheets...")
-    
-    # Get the sheet using the existing db_manager helper
-    # Note: This relies on db_manager looking at secrets.toml
-    sheet = db_manager.get_gsheet_connection()
-    if not sheet:
-        print("Failed to connect to Google Sheet. Check secrets.toml.")
-        return
+    try:
+        # Get the sheet using the existing db_manager helper
+        # Note: This relies on db_manager looking at secrets.toml
+        sheet = db_manager.get_gsheet_connection()
+        if not sheet:
+            print("Failed to connect to Google Sheet. Check secrets.toml.")
+            return
 
-    # Prepare data for sheets
-    # Expected headers: ["id", "date", "category", "description", "impact_metric", "company", "title"]
-    
-    rows_to_add = []
-    for _, row in df.iterrows():
-        # Generate new UUID for the sheet
-        new_id = str(uuid.uuid4())
-        
-        # Extract values, handling potential missing columns safely
-        date = row['date'] if 'date' in df.columns else ""
-        category = row['category'] if 'category' in df.columns else ""
-        description = row['description'] if 'description' in df.columns else ""
-        impact = row['impact_metric'] if 'impact_metric' in df.columns else ""
-        company = row['company'] if 'company' in df.columns else ""
-        title = row['title'] if 'title' in df.columns else ""
-        
-        # Append to our list
-        rows_to_add.append([
-            new_id,
-            date,
-            category,
-            description,
-            impact,
-            company,
-            title
-        ])
+        # Stream the table in chunks so peak memory is one chunk, not the whole table;
+        # each chunk is one append call
+        query = "SELECT * FROM accomplishments"
+        total = 0
+        try:
+            for chunk in pd.read_sql_query(query, conn, chunksize=CHUNK_ROWS):
+                rows_to_add = _build_rows(chunk)
+                sheet.append_rows(rows_to_add, value_input_option="RAW")
+                total += len(rows_to_add)
+                print(f"Wrote {total} rows to Google Sheet...")
+        except Exception as e:
+            print(f"Error migrating rows after {total} written: {e}")
+            return
+    finally:
+        conn.close()
 
-    print(f"Writing {len(rows_to_add)} rows to Google Sheet...")
-    try:
-        sheet.append_rows(rows_to_add)
+    if total == 0:
+        print("No data found in SQLite database to migrate.")
+    else:
         print("Migration successful!")
-    except Exception as e:
-        print(f"Error appending rows to sheet: {e}")
 
 if __name__ == "__main__":
     migrate_data()
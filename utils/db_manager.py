@@ -7,10 +7,13 @@ Requires 'gspread' and 'google-auth'.
 import streamlit as st
 import pandas as pd
 import gspread
+from gspread.utils import rowcol_to_a1
+import tenacity
 from google.oauth2.service_account import Credentials
 from typing import Optional, Dict, Any, List
 import uuid
 import datetime
+import threading
 
 # Constants
 SCOPES = [
@@ -18,6 +21,54 @@ SCOPES = [
     "https://www.googleapis.com/auth/drive"
 ]
 
+# Writes that look up a row number and then write to it must not interleave
+# (a row inserted or removed in between would shift the target). Reads don't take the lock.
+_WRITE_LOCK = threading.Lock()
+
+# Sheets API statuses worth retrying. A 429 is rejected before anything is applied, so any call
+# can be retried. A 5xx may or may not have been applied, so it is only retried for calls that
+# are safe to repeat (reads and writes to fixed ranges), never for appends.
+RATE_LIMIT_STATUS = {429}
+RETRYABLE_STATUS = {429, 500, 502, 503}
+
+
+def _retry_on(statuses):
+    """
+    tenacity retry decorator: jittered exponential backoff on gspread API errors with one of these statuses.
+    """
+    def is_retryable(exc: BaseException) -> bool:
+        response = getattr(exc, "response", None)
+        return isinstance(exc, gspread.exceptions.APIError) and getattr(response, "status_code", None) in statuses
+
+    return tenacity.retry(
+        stop=tenacity.stop_after_attempt(5),
+        wait=tenacity.wait_exponential_jitter(initial=1, max=30),
+        retry=tenacity.retry_if_exception(is_retryable),
+        reraise=True
+    )
+
+
+@_retry_on(RETRYABLE_STATUS)
+def _sheets_call(fn, *args, **kwargs):
+    """
+    Call an idempotent gspread method (read, or write to a fixed range), backing off and retrying
+    on rate limits and transient server errors instead of failing the user's action.
+    Other errors (and the last retryable one) propagate to the caller's error handling.
+    """
+    return fn(*args, **kwargs)
+
+
+@_retry_on(RATE_LIMIT_STATUS)
+def _sheets_append(fn, *args, **kwargs):
+    """
+    Like _sheets_call, for appends: retried only on 429, since repeating an append that the
+    server did apply would duplicate rows.
+    """
+    return fn(*args, **kwargs)
+
+# Set once the header check has passed in this process; the schema doesn't change under a running app
+_DB_INITIALIZED = False
+
 # Cache the connection to avoid re-authenticating on every run
 @st.cache_resource
 def get_gsheet_connection():
@@ -45,34 +96,43 @@ def get_gsheet_connection():
 def init_db() -> None:
     """
     Initialize the Google Sheet with required headers if empty.
+    Runs the check once per process; later reruns return without an API call.
     """
+    global _DB_INITIALIZED
+
+    if _DB_INITIALIZED:
+        return
+
     sheet = get_gsheet_connection()
     if not sheet:
         return
 
     try:
         # Check if headers exist (row 1)
-        headers = sheet.row_values(1)
-        # Added "user" to the end
-        expected_headers = ["id", "date", "category", "description", "impact_metric", "company", "title", "user"]
+        headers = _sheets_call(sheet.row_values, 1)
+        # Added "user" to the end, then "deleted" (soft-delete flag)
+        expected_headers = ["id", "date", "category", "description", "impact_metric", "company", "title", "user", "deleted"]
         
         if not headers:
             # Initialize headers
-            sheet.append_row(expected_headers)
+            _sheets_append(sheet.append_row, expected_headers)
+            _get_headers.clear()
             st.toast("Initialized Google Sheet headers.")
         else:
-            # Check if 'user' column is missing (migration)
-            if "user" not in headers:
-                # Append 'user' to the header row
-                # Append 'user' to the header row
+            # Check if 'user' / 'deleted' columns are missing (migration)
+            missing = [h for h in ("user", "deleted") if h not in headers]
+            if missing:
+                # Append the missing names to the header row, in order
                 # Find the next empty column
                 col_idx = len(headers) + 1
                 # update_cell is deprecated. Use update with cell coordinates converted to A1 or update_cells
-                # Easiest: use update_cells for a single cell
+                # Easiest: use update_cells
                 from gspread.cell import Cell
-                sheet.update_cells([Cell(1, col_idx, "user")])
-                # st.toast("Added 'user' column to database schema.")
-            
+                _sheets_call(sheet.update_cells, [Cell(1, col_idx + i, name) for i, name in enumerate(missing)])
+                _get_headers.clear()
+                # st.toast("Added missing columns to database schema.")
+
+        _DB_INITIALIZED = True
     except Exception as e:
         st.error(f"Error initializing DB: {e}")
 
@@ -89,85 +149,250 @@ def add_accomplishment(
     """
     Add a new accomplishment to the Google Sheet.
     """
+    add_accomplishments([{
+        "date": date,
+        "category": category,
+        "description": description,
+        "impact_metric": impact_metric,
+        "company": company,
+        "title": title,
+        "user": user
+    }])
+
+
+def add_accomplishments(entries: List[Dict[str, Any]]) -> List[str]:
+    """
+    Add several accomplishments with a single append call. Returns the new IDs.
+    Each dict takes the add_accomplishment fields ('user' defaults to "default").
+    """
     sheet = get_gsheet_connection()
-    if not sheet:
-        return
+    if not sheet or not entries:
+        return []
 
     try:
-        new_id = str(uuid.uuid4())
-        row_data = [
-            new_id,
-            date,
-            category,
-            description,
-            impact_metric if impact_metric else "",
-            company,
-            title,
-            user  # Add user
+        new_ids = [str(uuid.uuid4()) for _ in entries]
+        rows = [
+            [
+                new_id,
+                entry.get("date", ""),
+                entry.get("category", ""),
+                entry.get("description", ""),
+                entry.get("impact_metric") or "",
+                entry.get("company", ""),
+                entry.get("title", ""),
+                entry.get("user", "default"),  # Add user
+                ""  # deleted
+            ]
+            for new_id, entry in zip(new_ids, entries)
         ]
-        sheet.append_row(row_data)
+        # Append-only insert: the API adds the rows after the table, no read of existing rows needed.
+        # RAW keeps user text literal (USER_ENTERED would evaluate a description starting with "=").
+        _sheets_append(sheet.append_rows, rows, value_input_option="RAW", insert_data_option="INSERT_ROWS")
+        _invalidate_caches()
+        _get_id_row_map.clear()
+        return new_ids
     except Exception as e:
         st.error(f"Error adding accomplishment: {e}")
         raise e
 
 
-def get_accomplishments(user: str = None) -> pd.DataFrame:
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_all_records(_sheet) -> List[Dict[str, Any]]:
     """
-    Retrieve all accomplishments as a DataFrame, filtered by user.
+    Every row of the sheet as a list of dicts; the one full-sheet read, shared by all users and pages.
+    (_sheet is excluded from the cache key.)
+    """
+    # One values.get for header + data. Unlike get_all_records, cells stay as strings
+    # (no guessing that an ID or date is a number).
+    values = _sheets_call(_sheet.get_all_values)
+    if not values:
+        return []
+    headers, rows = values[0], values[1:]
+    return [dict(zip(headers, row)) for row in rows]
+
+
+def _invalidate_caches() -> None:
+    """
+    Drop cached sheet reads after a write.
+    """
+    _fetch_all_records.clear()
+    _get_accomplishments_cached.clear()
+
+
+def _query_accomplishments(user: Optional[str], limit: Optional[int], offset: int) -> pd.DataFrame:
+    """
+    Build the filtered, date-sorted accomplishments DataFrame.
+    Raises on connection/API errors so the cached wrapper never stores a failed read.
     """
     sheet = get_gsheet_connection()
     if not sheet:
+        raise RuntimeError("No Google Sheets connection")
+
+    # Get all values including headers (cached; filtering happens locally)
+    data = _fetch_all_records(sheet)
+    df = pd.DataFrame(data)
+    
+    # Ensure correct column order/existence if sheet is empty but has headers
+    expected_cols = ["id", "date", "category", "description", "impact_metric", "company", "title", "user"]
+    if df.empty:
+        return pd.DataFrame(columns=expected_cols)
+
+    # Handle missing 'user' column in old data (treat as NaN/empty)
+    if 'user' not in df.columns:
+        df['user'] = ""
+
+    # Hide soft-deleted rows; the flag itself isn't part of the editable record
+    if 'deleted' in df.columns:
+        df = df[df['deleted'].astype(str).str.upper() != "TRUE"].drop(columns=['deleted'])
+
+    # Filter by user if provided
+    if user:
+        # Filter rows where user matches OR user is empty (legacy data visibility optional?)
+        # Strict mode: Only show matching user
+        df = df[df['user'] == user].copy()
+        
+    # Sort by date descending if possible
+    if 'date' in df.columns:
+        # Dates are stored as ISO YYYY-MM-DD strings, which sort chronologically as text;
+        # no need to parse and re-format the column. Anything not in that form ("March 2024",
+        # "2024-3-5", blank) sorts as "" so it sinks to the bottom instead of above real dates.
+        df['date'] = df['date'].astype(str)
+        df = df.sort_values(
+            by='date',
+            ascending=False,
+            key=lambda dates: dates.where(dates.str.fullmatch(r"\d{4}-\d{2}-\d{2}"), "")
+        )
+        
+    if limit is not None:
+        df = df.iloc[offset:offset + limit]
+    return df
+
+
+def get_accomplishments(user: str = None, limit: Optional[int] = None, offset: int = 0) -> pd.DataFrame:
+    """
+    Retrieve all accomplishments as a DataFrame, filtered by user.
+    limit/offset return one page of the date-sorted result (the sheet has to be read whole to filter by user).
+    """
+    try:
+        return _query_accomplishments(user, limit, offset)
+    except Exception as e:
+        st.error(f"Error fetching accomplishments: {e}")
         return pd.DataFrame()
 
+
+@st.cache_resource(ttl=300, show_spinner=False)
+def _get_accomplishments_cached(user: str, limit: Optional[int], offset: int) -> pd.DataFrame:
+    """
+    Cache layer for get_accomplishments_cached. Errors propagate, so only successful reads are stored.
+    """
+    return _query_accomplishments(user, limit, offset)
+
+
+def get_accomplishments_cached(user: str, limit: Optional[int] = None, offset: int = 0) -> pd.DataFrame:
+    """
+    Cached get_accomplishments, keyed by user (and page, when limit/offset are given).
+    Streamlit reruns on nearly every widget interaction; this avoids a Sheets read per rerun.
+    Cleared (with _fetch_all_records) by every write in this module, so the TTL only bounds staleness from edits made outside the app.
+    Returns a shared DataFrame (no pickle/copy per hit): callers that mutate it must .copy() first.
+    A failed read shows an error and returns an empty, uncached frame; the next rerun tries again.
+    """
     try:
-        # Get all values including headers
-        data = sheet.get_all_records()
-        df = pd.DataFrame(data)
-        
-        # Ensure correct column order/existence if sheet is empty but has headers
-        expected_cols = ["id", "date", "category", "description", "impact_metric", "company", "title", "user"]
-        if df.empty:
-            return pd.DataFrame(columns=expected_cols)
-
-        # Handle missing 'user' column in old data (treat as NaN/empty)
-        if 'user' not in df.columns:
-            df['user'] = ""
-
-        # Filter by user if provided
-        if user:
-            # Filter rows where user matches OR user is empty (legacy data visibility optional?)
-            # Strict mode: Only show matching user
-            df = df[df['user'] == user].copy()
-            
-        # Sort by date descending if possible
-        if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-            df = df.sort_values(by='date', ascending=False)
-            # Convert back to string for display consistency if needed, but Streamlit handles dates well
-            df['date'] = df['date'].dt.strftime('%Y-%m-%d')
-            
-        return df
+        return _get_accomplishments_cached(user, limit, offset)
     except Exception as e:
         st.error(f"Error fetching accomplishments: {e}")
         return pd.DataFrame()
 
 
+@st.cache_data(ttl=60, show_spinner=False)
+def _get_id_row_map() -> Dict[str, int]:
+    """
+    Map of accomplishment ID -> sheet row number, built from one read of column A.
+    Lets writes locate their rows without a find() scan each time.
+    Updates and soft-deletes never move rows, so only inserts clear it; edits made
+    directly in the sheet can still move rows, so _resolve_rows checks positions before use.
+    """
+    sheet = get_gsheet_connection()
+    if not sheet:
+        return {}
+    ids = _sheets_call(sheet.col_values, 1)
+    # Row 1 is the header
+    return {str(id_val): row_num for row_num, id_val in enumerate(ids, start=1) if row_num > 1}
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _get_headers() -> List[str]:
+    """
+    Header row of the sheet. Only init_db changes it, and it clears this cache when it does.
+    """
+    sheet = get_gsheet_connection()
+    if not sheet:
+        return []
+    return _sheets_call(sheet.row_values, 1)
+
+
+def _resolve_rows(sheet, id_vals: List[Any]) -> Dict[str, Optional[int]]:
+    """
+    Sheet row numbers for several IDs (None where an ID doesn't exist).
+    Cached positions are confirmed with one batch_get of their A cells before use,
+    since the map can be up to a minute stale if rows were inserted, sorted or
+    removed directly in the sheet, and a stale row would send the write to another entry.
+    """
+    ids = [str(id_val) for id_val in id_vals]
+    id_map = _get_id_row_map()
+    candidates = {id_val: id_map[id_val] for id_val in ids if id_val in id_map}
+
+    rows: Dict[str, Optional[int]] = {}
+    if candidates:
+        cells = _sheets_call(sheet.batch_get, [f"A{row_num}" for row_num in candidates.values()])
+        for (id_val, row_num), cell in zip(candidates.items(), cells):
+            # Empty cells come back as an empty ValueRange
+            if cell and cell[0] and str(cell[0][0]) == id_val:
+                rows[id_val] = row_num
+        if len(rows) < len(candidates):
+            # The sheet has moved under the map; rebuild it on the next lookup
+            _get_id_row_map.clear()
+
+    for id_val in ids:
+        if id_val not in rows:
+            # Not in the map, or its cached row no longer holds it; scan the ID column
+            cell = _sheets_call(sheet.find, id_val, in_column=1)
+            rows[id_val] = cell.row if cell else None
+    return rows
+
+
+def _find_row(sheet, id_val: Any) -> Optional[int]:
+    """
+    Sheet row number for an ID, or None if it doesn't exist.
+    """
+    return _resolve_rows(sheet, [id_val]).get(str(id_val))
+
+
 def delete_accomplishment(id_val: Any) -> None:
     """
-    Delete an accomplishment by ID (UUID).
-    Note: gspread deletion requires finding the row number first.
+    Soft-delete an accomplishment by ID (UUID).
+    Sets the 'deleted' flag rather than removing the row, so other
+    rows keep their positions and nothing is lost if the wrong ID is pasted.
     """
     sheet = get_gsheet_connection()
     if not sheet:
         return
 
     try:
-        # Find cell with the ID
-        cell = sheet.find(str(id_val))
-        if cell:
-            sheet.delete_rows(cell.row)
-        else:
-            st.warning(f"Entry with ID {id_val} not found.")
+        with _WRITE_LOCK:
+            # init_db appends 'deleted' after whatever columns the sheet already has, so look it up
+            headers = _get_headers()
+            if "deleted" not in headers:
+                st.error("The sheet has no 'deleted' column; reload the app to run the schema migration.")
+                return
+            deleted_col = headers.index("deleted") + 1
+
+            row_num = _find_row(sheet, id_val)
+            if row_num:
+                cell = rowcol_to_a1(row_num, deleted_col)
+                _sheets_call(sheet.update, range_name=cell, values=[["TRUE"]], value_input_option="RAW")
+                _invalidate_caches()
+            else:
+                st.warning(f"Entry with ID {id_val} not found.")
     except Exception as e:
         st.error(f"Error deleting accomplishment: {e}")
 
@@ -175,22 +400,29 @@ def delete_accomplishment(id_val: Any) -> None:
 def get_accomplishment(id_val: str) -> Optional[Dict[str, Any]]:
     """
     Retrieve a single accomplishment by ID.
-    This is less efficient in GSheets than SQL, so we scan the DF.
+    Reads only that entry's row (headers are cached), not the whole sheet.
     """
-    # Note: This reads ALL data, potentially unsafe if we want strict isolation via API,
-    # but okay for now since we filter in get_accomplishments usually.
-    # To be safe, we should probably pass user here too, but for simplicity:
-    df = get_accomplishments() 
-    if df.empty:
+    sheet = get_gsheet_connection()
+    if not sheet:
+        return None
+
+    try:
+        row_num = _find_row(sheet, id_val)
+        if not row_num:
+            return None
+
+        headers = _get_headers()
+        values = _sheets_call(sheet.row_values, row_num)
+        # Trailing empty cells are omitted by the API; pad so every header gets a value
+        record = dict(zip(headers, values + [""] * (len(headers) - len(values))))
+
+        if str(record.get('deleted', '')).upper() == "TRUE":
+            return None
+        record.pop('deleted', None)
+        return record
+    except Exception as e:
+        st.error(f"Error fetching accomplishment: {e}")
         return None
-    
-    # Filter by ID
-    # Ensure ID string matching
-    row = df[df['id'].astype(str) == str(id_val)]
-    
-    if not row.empty:
-        return row.iloc[0].to_dict()
-    return None
 
 # Functions below are legacy or helpers that might not be strictly needed but kept for compatibility
 
@@ -213,48 +445,89 @@ def update_accomplishment(
         return
 
     try:
-        cell = sheet.find(str(id_val))
-        if cell:
-            row_num = cell.row
+        with _WRITE_LOCK:
+            row_num = _find_row(sheet, id_val)
+            if row_num:
             
-            # --- SECURITY CHECK (Optional but good) ---
-            # row_vals = sheet.row_values(row_num)
-            # if we wanted to enforce ownership check before write.
+                # --- SECURITY CHECK (Optional but good) ---
+                # row_vals = sheet.row_values(row_num)
+                # if we wanted to enforce ownership check before write.
             
-            # Update columns B through G (Date to Title) + H (User)
-            # Layout: A=id, B=date, C=cat, D=desc, E=impact, F=comp, G=title, H=user
-            # We assume 'user' is the 8th column (H) if it exists.
+                # Update columns B through G (Date to Title) + H (User)
+                # Layout: A=id, B=date, C=cat, D=desc, E=impact, F=comp, G=title, H=user
+                # We assume 'user' is the 8th column (H) if it exists.
             
-            # Since user might pass 'user' arg, let's update it too or keep it.
-            # For now, let's just update the content fields.
+                # Since user might pass 'user' arg, let's update it too or keep it.
+                # For now, let's just update the content fields.
             
-            range_name = f"B{row_num}:G{row_num}"
-            values = [[
-                date,
-                category,
-                description,
-                impact_metric if impact_metric else "",
-                company,
-                title
-            ]]
-            sheet.update(range_name=range_name, values=values)
+                range_name = f"B{row_num}:G{row_num}"
+                values = [[
+                    date,
+                    category,
+                    description,
+                    impact_metric if impact_metric else "",
+                    company,
+                    title
+                ]]
+                _sheets_call(sheet.update, range_name=range_name, values=values)
+                _invalidate_caches()
             
-            # Handle user column update separately if needed, or expand range to H
-        else:
-            st.warning(f"Could not find entry to update: {id_val}")
+                # Handle user column update separately if needed, or expand range to H
+            else:
+                st.warning(f"Could not find entry to update: {id_val}")
     except Exception as e:
         st.error(f"Error updating accomplishment: {e}")
 
 
+def update_accomplishments_bulk(rows: List[Dict[str, Any]]) -> int:
+    """
+    Update several accomplishments with a single batchUpdate call.
+    Each dict needs an 'id' plus the content fields. Returns the number of rows written.
+    """
+    sheet = get_gsheet_connection()
+    if not sheet or not rows:
+        return 0
+
+    try:
+        with _WRITE_LOCK:
+            data = []
+            # Resolved from the cached ID map and verified in one read, not a find() per row
+            row_nums = _resolve_rows(sheet, [row.get('id') for row in rows])
+            for row in rows:
+                row_num = row_nums.get(str(row.get('id')))
+                if not row_num:
+                    st.warning(f"Could not find entry to update: {row.get('id')}")
+                    continue
+
+                # Same B:G layout as update_accomplishment
+                data.append({
+                    "range": f"B{row_num}:G{row_num}",
+                    "values": [[
+                        str(row.get('date', '')),
+                        row.get('category', ''),
+                        row.get('description', ''),
+                        row.get('impact_metric') or "",
+                        row.get('company', ''),
+                        row.get('title', '')
+                    ]]
+                })
+
+            if data:
+                _sheets_call(sheet.batch_update, data)
+                _invalidate_caches()
+            return len(data)
+    except Exception as e:
+        st.error(f"Error updating accomplishments: {e}")
+        return 0
+
+
 def get_unique_tags(user: str = None) -> List[str]:
     """
     Retrieve all unique tags from the database.
     """
     df = get_accomplishments(user=user)
-    unique_tags = set()
-    if not df.empty and 'category' in df.columns:
-        for tags_str in df['category']:
-            if tags_str:
-                parts = [t.strip() for t in str(tags_str).split(',')]
-                unique_tags.update(parts)
-    return list(unique_tags)
+    if df.empty or 'category' not in df.columns:
+        return []
+    # Split every comma-separated category string in one vectorized pass
+    tags = df['category'].dropna().astype(str).str.split(',').explode().str.strip()
+    return tags[tags != ''].unique().tolist()
@@ -1,14 +1,23 @@
 import streamlit as st
 import datetime
+import functools
+import io
 import json
 import re
-from typing import List, Optional
+import time
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import google.generativeai as genai
 
 # Constants
 DEFAULT_MODEL = "gemini-flash-latest"
 FALLBACK_MODELS = ["gemini-1.5-flash", "gemini-flash-latest", "gemini-1.5-pro"]
 _API_INITIALIZED = False
+# Upper bound on waiting for an uploaded recording to leave PROCESSING
+AUDIO_PROCESSING_TIMEOUT_S = 60
+# JSON mode: the API returns a bare JSON document, no prose or markdown fences
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+# Compiled once; used on every streamed chunk
+_TRAILING_ESCAPE_RE = re.compile(r'\\(u[0-9a-fA-F]{0,3})?$')
 
 
 def init_gemini() -> bool:
@@ -33,24 +42,70 @@ def init_gemini() -> bool:
         return False
 
 
+@st.cache_resource(ttl=3600, show_spinner=False)
+def _fetch_model_names() -> List[str]:
+    """
+    Names of the models that support generateContent, fetched at most once an hour.
+    Raises on API errors, so a failed fetch is never cached.
+    """
+    return sorted(
+        m.name.replace('models/', '')
+        for m in genai.list_models()
+        if 'generateContent' in m.supported_generation_methods
+    )
+
+
 def get_available_models() -> List[str]:
     """
     Fetch a list of available models that support generateContent.
+    The list itself is cached as a shared resource (never mutated, so callers skip cache_data's copy);
+    FALLBACK_MODELS is returned, uncached, while the API is unreachable.
     """
     if not init_gemini():
         return FALLBACK_MODELS
     
     try:
-        models = []
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                models.append(m.name.replace('models/', ''))
-        return sorted(models) if models else FALLBACK_MODELS
+        return _fetch_model_names() or FALLBACK_MODELS
     except Exception as e:
         st.error(f"Error fetching models: {e}")
         return FALLBACK_MODELS
 
 
+def get_model_options() -> Tuple[List[str], int]:
+    """
+    Model list for the selector plus the index of DEFAULT_MODEL (0 if unavailable).
+    """
+    models = get_available_models()
+    try:
+        default_index = models.index(DEFAULT_MODEL)
+    except ValueError:
+        default_index = 0
+    return models, default_index
+
+
+@functools.lru_cache(maxsize=8)
+def _get_model(model_name: str) -> genai.GenerativeModel:
+    """
+    One GenerativeModel per model name, shared across reruns and sessions (it holds no per-request state).
+    A plain lru_cache: nothing Streamlit-specific is involved, so this also works with Streamlit mocked out.
+    Call only after init_gemini() has succeeded.
+    """
+    return genai.GenerativeModel(model_name)
+
+
+def _prepare_request(
+    prompt: str,
+    context_data: Optional[str],
+    model_name: str
+) -> Tuple[genai.GenerativeModel, str]:
+    """
+    Build the model and prompt for a request, with context_data (if any) ahead of the task.
+    """
+    if context_data:
+        return _get_model(model_name), f"Context Data:\n{context_data}\n\nTask:\n{prompt}"
+    return _get_model(model_name), prompt
+
+
 def generate_content(
     prompt: str,
     context_data: Optional[str] = None,
@@ -64,12 +119,7 @@ def generate_content(
         return "Error: Gemini API not configured. Please check your API key."
     
     try:
-        model = genai.GenerativeModel(model_name)
-        
-        if context_data:
-            full_prompt = f"Context Data:\n{context_data}\n\nTask:\n{prompt}"
-        else:
-            full_prompt = prompt
+        model, full_prompt = _prepare_request(prompt, context_data, model_name)
             
         content = [full_prompt]
         if attachments:
@@ -94,18 +144,21 @@ def generate_content(
 
 
 def process_audio_to_form(
-    audio_bytes: bytes,
+    audio_file: Union[IO[bytes], bytes, memoryview],
     mime_type: str,
     model_name: str = DEFAULT_MODEL
 ) -> Optional[dict]:
     """
     Process audio recording and extract structured completion data.
+    Accepts a file-like object (e.g. Streamlit's UploadedFile) or a bytes-like buffer;
+    either is sent through the Files API (resumable upload) rather than buffered inline.
     """
     if not init_gemini():
         return None
     
+    file_ref = None
     try:
-        model = genai.GenerativeModel(model_name)
+        model = _get_model(model_name)
         
         prompt = f"""
         Analyze this audio recording of someone describing a professional accomplishment.
@@ -125,24 +178,40 @@ def process_audio_to_form(
         Result must be ONLY the JSON block.
         """
         
-        # Audio input for Gemini
-        audio_part = {
-            "mime_type": mime_type,
-            "data": audio_bytes
-        }
+        # Upload straight from the file object; no intermediate bytes copy
+        if isinstance(audio_file, (bytes, bytearray, memoryview)):
+            audio_file = io.BytesIO(audio_file)
+        elif audio_file.seekable():
+            # Callers may have hashed or peeked at the stream already
+            audio_file.seek(0)
+        file_ref = genai.upload_file(path=audio_file, mime_type=mime_type)
+        deadline = time.monotonic() + AUDIO_PROCESSING_TIMEOUT_S
+        while file_ref.state.name == "PROCESSING":
+            if time.monotonic() > deadline:
+                st.error("Gemini took too long to process the recording. Please try again.")
+                return None
+            time.sleep(0.5)
+            file_ref = genai.get_file(file_ref.name)
+        if file_ref.state.name == "FAILED":
+            st.error("Gemini could not process the recording. Please try again.")
+            return None
         
-        response = model.generate_content([prompt, audio_part])
+        # JSON mode: the reply is the object itself, no need to fish it out of prose
+        response = model.generate_content([prompt, file_ref], generation_config=JSON_GENERATION_CONFIG)
         
-        # Extract JSON from response
-        text = response.text
-        json_match = re.search(r'\{.*\}', text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        return None
+        parsed = json.loads(response.text)
+        return parsed if isinstance(parsed, dict) else None
         
     except Exception as e:
         st.error(f"Error processing audio: {e}")
         return None
+    finally:
+        # Uploaded files expire on their own, but there's no reason to keep recordings around
+        if file_ref is not None:
+            try:
+                genai.delete_file(file_ref.name)
+            except Exception:
+                pass
 
 
 def generate_structured_content(
@@ -157,17 +226,10 @@ def generate_structured_content(
         return None
     
     try:
-        model = genai.GenerativeModel(model_name)
-        
-        # Enforce JSON instruction
-        structure_instruction = "\n\nCRITICAL: Return your response ONLY as valid JSON. Do not include markdown formatting like ```json ... ```. Just the raw JSON string."
-        
-        if context_data:
-            full_prompt = f"Context Data:\n{context_data}\n\nTask:\n{prompt}{structure_instruction}"
-        else:
-            full_prompt = f"{prompt}{structure_instruction}"
+        model, full_prompt = _prepare_request(prompt, context_data, model_name)
             
-        response = model.generate_content(full_prompt)
+        # Enforce JSON output
+        response = model.generate_content(full_prompt, generation_config=JSON_GENERATION_CONFIG)
         
         # Robust error handling
         if not response.candidates:
@@ -179,26 +241,88 @@ def generate_structured_content(
             st.error(f"Error: Model stopped unexpectedly. Reason: {candidate.finish_reason}.")
             return None
             
-        text_content = response.text
-        
-        # Clean up potential markdown code blocks if the model ignores the "raw JSON" instruction
-        text_content = re.sub(r'^```json\s*', '', text_content)
-        text_content = re.sub(r'^```\s*', '', text_content)
-        text_content = re.sub(r'\s*```$', '', text_content)
-        
-        try:
-            return json.loads(text_content)
-        except json.JSONDecodeError as e:
-            st.error(f"Error decoding JSON from model output: {e}")
-            st.text("Raw output:")
-            st.code(text_content)
-            return None
+        return parse_structured_output(response.text)
             
     except Exception as e:
         st.error(f"Error generating structured content: {e}")
         return None
 
 
+class GenerationStopped(Exception):
+    """A streamed generation failed or stopped early (safety, token limit, ...); the error was already shown."""
+
+
+def generate_content_stream(
+    prompt: str,
+    context_data: Optional[str] = None,
+    model_name: str = DEFAULT_MODEL,
+    json_output: bool = False
+) -> Iterator[str]:
+    """
+    Stream generated text from Gemini chunk by chunk (suitable for st.write_stream).
+    With json_output=True the model runs in JSON mode; parse the joined text with parse_structured_output.
+    Raises GenerationStopped (after showing the error) if the stream fails or ends on anything
+    but a normal STOP, so callers don't treat truncated text as a complete response.
+    """
+    if not init_gemini():
+        return
+    
+    try:
+        model, full_prompt = _prepare_request(prompt, context_data, model_name)
+        generation_config = JSON_GENERATION_CONFIG if json_output else None
+        
+        last_chunk = None
+        for chunk in model.generate_content(full_prompt, generation_config=generation_config, stream=True):
+            last_chunk = chunk
+            # Chunks without parts (e.g. a final safety/finish marker) have no text
+            if chunk.parts:
+                yield chunk.text
+    except Exception as e:
+        st.error(f"Error streaming content: {e}")
+        raise GenerationStopped(str(e)) from e
+
+    # The finish reason arrives on the final chunk
+    if last_chunk is None or not last_chunk.candidates:
+        st.error("Error: No candidates returned from Gemini.")
+        raise GenerationStopped("no candidates")
+    candidate = last_chunk.candidates[0]
+    if candidate.finish_reason != 1: # 1 = STOP
+        st.error(f"Error: Model stopped unexpectedly. Reason: {candidate.finish_reason}. Safety Ratings: {candidate.safety_ratings}")
+        raise GenerationStopped(str(candidate.finish_reason))
+
+
+def parse_structured_output(text_content: str) -> Optional[dict]:
+    """
+    Parse a JSON-mode model response.
+    """
+    try:
+        return json.loads(text_content)
+    except json.JSONDecodeError as e:
+        st.error(f"Error decoding JSON from model output: {e}")
+        st.text("Raw output:")
+        st.code(text_content)
+        return None
+
+
+def parse_partial_fields(text_content: str, fields: Iterable[str]) -> Dict[str, str]:
+    """
+    Pull top-level string fields out of a JSON response that may still be streaming.
+    A field whose value hasn't closed yet is returned as far as it has arrived.
+    """
+    found = {}
+    for field in fields:
+        match = re.search(r'"%s"\s*:\s*"((?:[^"\\]|\\.)*)' % re.escape(field), text_content, re.DOTALL)
+        if not match:
+            continue
+        # Drop a trailing escape that was cut mid-sequence (e.g. "\" or "\u00") before decoding
+        raw = _TRAILING_ESCAPE_RE.sub('', match.group(1))
+        try:
+            found[field] = json.loads(f'"{raw}"', strict=False)
+        except json.JSONDecodeError:
+            found[field] = raw
+    return found
+
+
 def check_api_status() -> dict:
     """
     Check Gemini API status and usage limits.
@@ -212,7 +336,7 @@ def check_api_status() -> dict:
     
     try:
         # Make a minimal test call to check API status
-        model = genai.GenerativeModel(DEFAULT_MODEL)
+        model = _get_model(DEFAULT_MODEL)
         response = model.generate_content("test", generation_config={"max_output_tokens": 1})
         
         return {
@@ -1,11 +1,13 @@
+import functools
+import html
 import markdown
-from xhtml2pdf import pisa
-from io import BytesIO
+import os
+from jinja2 import Environment, FileSystemLoader
 import datetime
+import threading
 
 # Shared CSS for consistent styling
 BASE_CSS = """
-<style>
     @page {
         size: letter;
         margin: 2.0cm;
@@ -63,12 +65,10 @@ BASE_CSS = """
         margin-bottom: 15px;
     }
 
-</style>
 """
 
 # Compact CSS for Cover Letter to ensure single-page fit
 CL_CSS = """
-<style>
     @page {
         size: letter;
         margin: 1.5cm; /* Reduced margins */
@@ -101,199 +101,97 @@ CL_CSS = """
         margin-bottom: 15px;
     }
 
-</style>
 """
 
-def _generate_pdf_from_html(html_content, css=BASE_CSS):
+# One Markdown instance, reused for every cover letter instead of building a parser per call.
+# Markdown objects keep state between conversions, so callers hold the lock around reset().convert().
+_MD = markdown.Markdown()
+_MD_LOCK = threading.Lock()
+
+def _refuse_url(url, *args, **kwargs):
     """
-    Helper to convert HTML string to PDF bytes.
+    WeasyPrint URL fetcher that loads nothing. The documents use no external resources, and the
+    default fetcher would follow file:// and http(s):// links found in user/LLM-written text.
     """
-    full_html = f"""
-    <html>
-    <head>
-        {css}
-    </head>
-    <body>
-        {html_content}
+    raise ValueError(f"External resources are disabled: {url}")
 
-    </body>
-    </html>
+# WeasyPrint is imported inside the PDF path rather than at module level: it loads Pango when
+# imported, and the rest of the app should still start on machines without those libraries.
+@functools.lru_cache(maxsize=None)
+def _stylesheet(css_text):
     """
-    
-    result_file = BytesIO()
-    pisa_status = pisa.CreatePDF(
-        src=full_html,
-        dest=result_file
-    )
-    
-    if pisa_status.err:
-        return None
-    
-    return result_file.getvalue()
-
-def _format_contact_header(contact_info):
+    Parsed stylesheet for a CSS string, built on first use and reused for every later PDF.
     """
-    Helper to create the standard contact header.
+    from weasyprint import CSS
+    return CSS(string=css_text, url_fetcher=_refuse_url)
+
+# Templates are compiled once here; autoescape keeps '&', '<' etc. in user text from breaking the HTML
+_TEMPLATE_ENV = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates")),
+    autoescape=True,
+    trim_blocks=True,
+    lstrip_blocks=True
+)
+_RESUME_TEMPLATE = _TEMPLATE_ENV.get_template("resume.html")
+_COVER_LETTER_TEMPLATE = _TEMPLATE_ENV.get_template("cover_letter.html")
+
+def _generate_pdf_from_html(full_html, css=BASE_CSS):
     """
-    parts = []
-    # Order: Email | Phone | LinkedIn
-    if contact_info.get('email'): parts.append(contact_info['email'])
-    if contact_info.get('phone'): parts.append(contact_info['phone'])
-    if contact_info.get('linkedin'): parts.append(contact_info['linkedin'])
-    
-    contact_line = " | ".join(parts)
-    
-    return f"""
-    <div class="header">
-        <div class="name">{contact_info.get('name', '')}</div>
-        <div class="contact-info">{contact_line}</div>
-    </div>
+    Helper to convert a rendered HTML document to PDF bytes.
+    Rendering errors are left to the caller, which reports them to the user.
     """
+    from weasyprint import HTML
+    return HTML(string=full_html, url_fetcher=_refuse_url).write_pdf(stylesheets=[_stylesheet(css)])
 
 def create_cover_letter_pdf(data, contact_info):
     """
     Generates a Cover Letter PDF from structured data.
     """
-    header = _format_contact_header(contact_info)
-    
     today = datetime.date.today().strftime("%B %d, %Y")
     company = data.get('Company', 'Hiring Manager')
     
-    # Simple formatting for the body: convert newlines to <br/> or paragraphs
     # Assuming text comes as a big string block from LLM
     body_text = data.get('Cover Letter', '')
-    # Convert markdown bold to html bold if present
-    body_html = markdown.markdown(body_text)
-
-    content = f"""
-    {header}
-    <div style="margin-top: 20px; margin-bottom: 15px;">
-        {today}
-    </div>
-    <div style="margin-bottom: 15px;">
-        <strong>Hiring Team</strong><br/>
-        {company}
-    </div>
-    
-    <div class="section-content">
-        {body_html}
-    </div>
-    
-    <div style="margin-top: 30px;">
-        Sincerely,<br/>
-        <br/>
-        {contact_info.get('name', '')}
-    </div>
-    """
+    # Convert markdown (bold, paragraphs) to html. Escape first: Markdown passes raw HTML through,
+    # and the letter is editable text, so only Markdown's own tags should reach the document.
+    with _MD_LOCK:
+        body_html = _MD.reset().convert(html.escape(body_text, quote=False))
+
+    page_html = _COVER_LETTER_TEMPLATE.render(
+        contact=contact_info,
+        today=today,
+        company=company,
+        body_html=body_html
+    )
     
     # Use CL_CSS specifically
-    return _generate_pdf_from_html(content, css=CL_CSS)
+    return _generate_pdf_from_html(page_html, css=CL_CSS)
 
 def create_resume_pdf(data, contact_info):
     """
     Generates a Resume PDF from structured data.
     """
-    header = _format_contact_header(contact_info)
-    
     resume_data = data.get('Resume', {})
-    summary = resume_data.get('Professional Summary', '')
-    experience = resume_data.get('Experience', {})
-    
-    # Build Experience HTML
-    experience_html = ""
-    
-    # Iterate through experience. 
-    # Note: The dictionary keys are "Job Title, Company". 
-    # We might want to parse that or just display it.
-    # The structure implies keys are unique identifiers.
-    for job_key, job_details in experience.items():
-        title_company = job_key
-        start = job_details.get('Start Date', '')
-        end = job_details.get('End Date', '')
-        job_summary = job_details.get('Summary', '')
-        accomplishments = job_details.get('Accomplishments', [])
-        
-        acc_bullets = ""
-        for acc in accomplishments:
-            acc_bullets += f"<li>{acc}</li>"
-            
-        experience_html += f"""
-        <div class="job-entry">
-            <!-- Table layout for Title + Date alignment -->
-            <table style="width: 100%; border: none; margin-bottom: 2px;">
-                <tr>
-                    <td style="text-align: left; padding: 0;">
-                        <h2>{title_company}</h2>
-                    </td>
-                    <td style="text-align: right; vertical-align: bottom; padding: 0; width: 150px;">
-                        <span class="job-meta">{start} - {end}</span>
-                    </td>
-                </tr>
-            </table>
-            <p>{job_summary}</p>
-            <ul>
-                {acc_bullets}
-            </ul>
-        </div>
-        """
-        
-
-    # Build Education HTML first (Requested Order: Education -> Experience)
-    education = resume_data.get('Education', {})
-    education_html = ""
-    if education:
-        for degree_key, edu_details in education.items():
-            degree_type = edu_details.get('Type of Degree', '')
-            major = edu_details.get('Major', '')
-            school = edu_details.get('School', '')
-            grad_date = edu_details.get('Graduation Date', '')
-            info = edu_details.get('Information of Note', '')
-            
-            # Formatting line: "BSc in Computer Science" or just "Computer Science"
-            degree_line = f"{degree_type} in {major}" if degree_type and major else (degree_type or major or degree_key)
-            
-            # Single line format: **School** | Degree | Date | Note
-            # We use spans with separators
-            parts = [f"<strong>{school}</strong>"]
-            if degree_line: parts.append(degree_line)
-            if grad_date: parts.append(grad_date)
-            if info: parts.append(f"<em>{info}</em>")
-            
-            single_line_entry = " | ".join(parts)
-            
-            education_html += f"""
-            <div class="edu-entry" style="margin-bottom: 5px;">
-                {single_line_entry}
-            </div>
-            """
-
-    content = f"""
-    {header}
-    """
-
-    content += f"""
-    <h1>Professional Summary</h1>
-    <div class="section-content">
-        {summary}
-    </div>
-    """
-
-    if education_html:
-        content += f"""
-        <h1>Education</h1>
-        <div class="section-content">
-            {education_html}
-        </div>
-        """
-    
-    content += f"""
-    <h1>Professional Experience</h1>
-    <div class="section-content">
-        {experience_html}
-    </div>
-    """
-    
-    # Build Education HTML
 
+    # Flatten education into display fields; the template handles the markup
+    education = []
+    for degree_key, edu_details in resume_data.get('Education', {}).items():
+        degree_type = edu_details.get('Type of Degree', '')
+        major = edu_details.get('Major', '')
+        # Formatting line: "BSc in Computer Science" or just "Computer Science"
+        degree_line = f"{degree_type} in {major}" if degree_type and major else (degree_type or major or degree_key)
+        education.append({
+            'school': edu_details.get('School', ''),
+            'degree_line': degree_line,
+            'grad_date': edu_details.get('Graduation Date', ''),
+            'info': edu_details.get('Information of Note', '')
+        })
+
+    page_html = _RESUME_TEMPLATE.render(
+        contact=contact_info,
+        summary=resume_data.get('Professional Summary', ''),
+        education=education,
+        experience=resume_data.get('Experience', {})
+    )
     
-    return _generate_pdf_from_html(content)
+    return _generate_pdf_from_html(page_html)